@@ -5,10 +5,359 @@ This module provides comprehensive metrics for evaluating the quality and perfor
 of the RAG retrieval system, including relevance scoring, coverage analysis, and latency tracking.
 """
 
+import bisect
+import math
+import os
+import tempfile
 import time
+import weakref
 import numpy as np
+from array import array
 from typing import List, Dict, Any, Tuple
-from collections import defaultdict
+from collections import Counter
+from itertools import chain
+
+from .retrieval_config import DOMAIN_CONFIG
+
+try:
+    from hdrh.histogram import HdrHistogram
+except ImportError:  # hdrhistogram is optional; only needed for latency_estimator="hdr"
+    HdrHistogram = None
+
+
+# HDR histogram range for latencies, in microseconds: 1us to 60s at 3 significant figures
+_HDR_LOWEST_US = 1
+_HDR_HIGHEST_US = 60_000_000
+_HDR_SIGNIFICANT_FIGURES = 3
+
+_NS_PER_MS = 1_000_000
+
+# Below this many latencies the P-square markers are too coarse for tail
+# percentiles, so get_latency_percentiles() reads the stored samples exactly.
+# The streaming estimators also keep only this many raw latencies by default.
+_P2_MIN_SAMPLES = 500
+
+
+# Bit position of each configured domain in a domain bitmap
+DOMAIN_IDS = {domain["name"]: i for i, domain in enumerate(DOMAIN_CONFIG["domains"])}
+
+# Per-query benchmark scores, stored contiguously for vectorized summaries
+_RESULT_DTYPE = np.dtype([
+    ("precision", np.float64),
+    ("recall", np.float64),
+    ("f1", np.float64),
+    ("relevance", np.float64)
+])
+
+
+def _relevance_summary_loop(scores: np.ndarray, k: int, threshold: float) -> Tuple[float, float]:
+    """
+    Single pass over relevance scores returning (top-k precision, MRR).
+    The k largest scores are tracked in an inline min-heap. Compiled with numba.
+    """
+    n = scores.size
+    best = scores[0]
+    heap = np.empty(max(k, 1), dtype=scores.dtype)
+    for i in range(n):
+        score = scores[i]
+        if score > best:
+            best = score
+        if i < k:
+            # Sift up while filling the heap
+            heap[i] = score
+            child = i
+            while child > 0:
+                parent = (child - 1) // 2
+                if heap[parent] <= heap[child]:
+                    break
+                heap[parent], heap[child] = heap[child], heap[parent]
+                child = parent
+        elif k > 0 and score > heap[0]:
+            # Replace the smallest of the top k and sift down
+            heap[0] = score
+            parent = 0
+            while True:
+                smallest = parent
+                left = 2 * parent + 1
+                right = left + 1
+                if left < k and heap[left] < heap[smallest]:
+                    smallest = left
+                if right < k and heap[right] < heap[smallest]:
+                    smallest = right
+                if smallest == parent:
+                    break
+                heap[parent], heap[smallest] = heap[smallest], heap[parent]
+                parent = smallest
+
+    precision = 0.0
+    if k > 0 and n >= k:
+        relevant = 0
+        for i in range(k):
+            if heap[i] > threshold:
+                relevant += 1
+        precision = relevant / k
+    mrr = 1.0 if best > threshold else 0.0
+    return precision, mrr
+
+
+def _relevance_summary_numpy(scores: np.ndarray, k: int, threshold: float) -> Tuple[float, float]:
+    """NumPy equivalent of _relevance_summary_loop, used when numba is not installed."""
+    precision = 0.0
+    if k > 0 and scores.size >= k:
+        top_k_scores = scores[np.argpartition(-scores, k - 1)[:k]]
+        precision = float((top_k_scores > threshold).mean())
+    mrr = 1.0 if scores.max() > threshold else 0.0
+    return precision, mrr
+
+
+def _mean_similarity_loop(distances: np.ndarray) -> float:
+    """
+    Mean similarity (1 - distance) over equal-length result sets, where the mean of
+    row means equals the overall mean. Compiled with numba.
+    """
+    total = 0.0
+    rows, cols = distances.shape
+    for i in range(rows):
+        for j in range(cols):
+            total += distances[i, j]
+    return 1.0 - total / (rows * cols)
+
+
+def _mean_similarity_numpy(distances: np.ndarray) -> float:
+    """NumPy equivalent of _mean_similarity_loop, used when numba is not installed."""
+    return 1.0 - distances.mean(dtype=np.float64)
+
+
+_kernels = None
+
+
+def _get_kernels():
+    """
+    (relevance summary, mean similarity) kernels, compiled with numba on first use.
+    numba is optional and slow to import, so it is only loaded when a kernel runs;
+    the NumPy fallbacks are used when it is not installed.
+    """
+    global _kernels
+    if _kernels is None:
+        try:
+            from numba import njit
+        except ImportError:
+            _kernels = (_relevance_summary_numpy, _mean_similarity_numpy)
+        else:
+            _kernels = (njit(cache=True)(_relevance_summary_loop), njit(cache=True)(_mean_similarity_loop))
+    return _kernels
+
+
+def _relevance_summary(scores: np.ndarray, k: int, threshold: float) -> Tuple[float, float]:
+    """Top-k precision and MRR of the scores in one pass."""
+    return _get_kernels()[0](scores, k, threshold)
+
+
+def _mean_similarity(distances: np.ndarray) -> float:
+    """Mean similarity over equal-length result sets."""
+    return _get_kernels()[1](distances)
+
+
+class _SampleBuffer:
+    """
+    Append-only numeric sample store backed by a contiguous NumPy array.
+
+    Grows geometrically when unbounded. With max_size set it becomes a ring buffer
+    that keeps only the most recent max_size samples, and with path set the ring
+    lives in a numpy.memmap so long sessions keep their samples off the heap.
+    Samples are not kept in insertion order once the ring wraps; all consumers
+    compute order-independent statistics.
+    """
+    
+    def __init__(self, dtype, initial_size: int = 1024, max_size: int = None, path: str = None):
+        if path is not None and max_size is None:
+            raise ValueError("A memmap-backed sample buffer requires max_size")
+        self.max_size = max_size
+        self._initial_size = min(initial_size, max_size or initial_size)
+        self._memmapped = path is not None
+        if self._memmapped:
+            self._buf = np.memmap(path, dtype=dtype, mode="w+", shape=(max_size,))
+        else:
+            self._buf = np.empty(self._initial_size, dtype=dtype)
+        self._n = 0
+        self._next = 0  # Write position within the ring
+    
+    def __len__(self) -> int:
+        return self._n
+    
+    def _reserve(self, size: int):
+        """Grow the backing array (doubling) so it holds at least size samples."""
+        if size <= self._buf.size:
+            return
+        capacity = self._buf.size
+        while capacity < size:
+            capacity *= 2
+        if self.max_size is not None:
+            capacity = min(capacity, self.max_size)
+        self._buf = np.resize(self._buf, capacity)
+    
+    def append(self, values) -> None:
+        """Append one or more samples."""
+        values = np.asarray(values, dtype=self._buf.dtype).ravel()
+        size = values.size
+        if self.max_size is None:
+            self._reserve(self._n + size)
+            self._buf[self._n:self._n + size] = values
+            self._n += size
+            return
+        
+        self._reserve(min(self._n + size, self.max_size))
+        if size >= self.max_size:
+            self._buf[:] = values[-self.max_size:]
+            self._n = self.max_size
+            self._next = 0
+            return
+        start = self._next
+        end = start + size
+        if end <= self.max_size:
+            self._buf[start:end] = values
+        else:
+            split = self.max_size - start
+            self._buf[start:] = values[:split]
+            self._buf[:end - self.max_size] = values[split:]
+        self._next = end % self.max_size
+        self._n = min(self._n + size, self.max_size)
+    
+    def append_one(self, value: float) -> None:
+        """Append a single sample, skipping the array conversion done by append()."""
+        if self.max_size is None:
+            if self._n == self._buf.size:
+                self._reserve(self._n + 1)
+            self._buf[self._n] = value
+            self._n += 1
+            return
+        
+        if self._next == self._buf.size:
+            self._reserve(self._next + 1)
+        self._buf[self._next] = value
+        self._next = (self._next + 1) % self.max_size
+        self._n = min(self._n + 1, self.max_size)
+    
+    def next_evicted(self):
+        """Sample the next append_one() will overwrite, or None while the ring has room."""
+        if self.max_size is None or self._n < self.max_size:
+            return None
+        return self._buf[self._next]
+    
+    def view(self) -> np.ndarray:
+        """Stored samples as a contiguous array view."""
+        return self._buf[:self._n]
+    
+    def clear(self) -> None:
+        """Drop all samples, keeping the allocated storage."""
+        self._n = 0
+        self._next = 0
+    
+    def release(self) -> None:
+        """Drop all samples and shrink in-memory storage back to its initial size."""
+        self.clear()
+        if not self._memmapped:
+            self._buf = np.empty(self._initial_size, dtype=self._buf.dtype)
+
+
+class _P2Quantile:
+    """
+    Streaming quantile estimate using the P-square algorithm (Jain & Chlamtac, 1985).
+
+    Keeps five markers whose heights track the minimum, p/2, p, (1+p)/2 and maximum
+    quantiles, so each update is O(1) and memory is constant regardless of how many
+    samples are seen. Until five samples arrive the exact quantile is returned.
+    """
+    
+    def __init__(self, p: float):
+        self.p = p
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+        self._heights = []
+        self.reset()
+    
+    def reset(self) -> None:
+        """Forget all observations."""
+        p = self.p
+        self.count = 0
+        self._heights.clear()
+        self._positions = [0, 1, 2, 3, 4]
+        self._desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+    
+    def update(self, x: float) -> None:
+        """Add one observation."""
+        self.count += 1
+        q = self._heights
+        if self.count <= 5:
+            q.append(x)
+            if self.count == 5:
+                q.sort()
+            return
+        
+        # Find the cell containing x, extending the extremes if needed
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+        
+        n = self._positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+        
+        # Move the three middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                # Piecewise-parabolic prediction, falling back to linear
+                height = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                    + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+                )
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+    
+    def value(self) -> float:
+        """Current quantile estimate."""
+        if self.count == 0:
+            return 0.0
+        if self.count < 5:
+            return float(np.percentile(self._heights, self.p * 100))
+        return float(self._heights[2])
+    
+    def min(self) -> float:
+        """Smallest observation seen."""
+        return float(min(self._heights)) if self._heights else 0.0
+    
+    def max(self) -> float:
+        """Largest observation seen."""
+        return float(max(self._heights)) if self._heights else 0.0
+
+
+def _remove_files(paths: Tuple[str, ...]) -> None:
+    """Best-effort removal of sample files; already-missing files are ignored."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _sorted_percentile(ordered: array, q: float) -> float:
+    """Percentile of an already sorted list with linear interpolation, in O(1)."""
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
 
 
 class RetrievalMetrics:
@@ -16,26 +365,172 @@ class RetrievalMetrics:
     Comprehensive metrics collection and evaluation for retrieval quality.
     """
     
-    def __init__(self):
-        """Initialize metrics collector."""
+    LATENCY_ESTIMATORS = ("exact", "p2", "hdr", "sorted")
+    
+    def __init__(self, max_samples: int = None, storage_dir: str = None,
+                 latency_estimator: str = "exact", keep_latency_samples: bool = False):
+        """
+        Initialize metrics collector.
+        
+        Args:
+            max_samples: Keep only the most recent max_samples latencies and relevance
+                scores (ring buffer). None keeps every sample.
+            storage_dir: Directory for memory-mapped sample files, for long-running
+                sessions. Requires max_samples. Each instance creates its own
+                uniquely named files, so several instances can share a directory;
+                they are deleted by close() or when the instance is collected.
+            latency_estimator: How latency percentiles are computed. "exact" sorts the
+                stored samples on each call; "p2" keeps O(1) streaming P-square
+                estimates over every recorded latency (exact percentiles over the
+                stored samples are reported until enough latencies arrive for the
+                estimates to settle); "hdr" records into a fixed-size HDR histogram
+                (requires the hdrhistogram package); "sorted" keeps latencies in a
+                compact int64 array in sorted order with bisect.insort (with
+                max_samples set, latencies leaving the ring are removed again, so
+                it covers the same samples as "exact").
+            keep_latency_samples: With "p2" or "hdr" and no max_samples, raw
+                latencies are kept only for the most recent few hundred queries so
+                memory stays constant. Set this to keep every raw latency (e.g.
+                for debugging).
+        
+        Choosing an estimator: "sorted" makes every percentile read O(1) at the cost
+        of an O(n) list insert per sample, so it wins over "exact" while reads are
+        frequent and n is moderate (up to roughly 10^5 samples). Past that the
+        per-insert memmove dominates and "p2" (O(1) update, approximate) or "hdr"
+        (O(1) update, bounded relative error) scale better.
+        """
+        if latency_estimator not in self.LATENCY_ESTIMATORS:
+            raise ValueError(
+                f"Unknown latency estimator '{latency_estimator}', "
+                f"expected one of {self.LATENCY_ESTIMATORS}"
+            )
+        if latency_estimator == "hdr" and HdrHistogram is None:
+            raise ImportError("latency_estimator='hdr' requires the hdrhistogram package")
+        self.latency_estimator = latency_estimator
+        self._p2_quantiles = self._new_p2_quantiles()
+        self._hdr = None
+        if latency_estimator == "hdr":
+            self._hdr = HdrHistogram(_HDR_LOWEST_US, _HDR_HIGHEST_US, _HDR_SIGNIFICANT_FIGURES)
+        # array('q') stores 8 bytes per sample versus ~36 for a list of Python ints
+        self._sorted_latencies = array("q") if latency_estimator == "sorted" else None
         self.query_count = 0
-        self.total_latency = 0
-        self.latencies = []
-        self.relevance_scores = []
-        self.domain_coverage = defaultdict(int)
-        self.chunk_hits = defaultdict(int)
+        self._total_latency_ns = 0
+        latency_path = scores_path = None
+        self._finalizer = None
+        if storage_dir is not None:
+            latency_path = self._new_sample_file(storage_dir, "latencies-")
+            scores_path = self._new_sample_file(storage_dir, "relevance_scores-")
+            self._finalizer = weakref.finalize(self, _remove_files, (latency_path, scores_path))
+        latency_window = max_samples
+        if latency_window is None and latency_estimator in ("p2", "hdr") and not keep_latency_samples:
+            # Streaming estimators only need recent raw samples for the P-square warm-up
+            latency_window = _P2_MIN_SAMPLES
+        # Latencies are stored as integer nanoseconds and converted to ms on read
+        self._latencies = _SampleBuffer(np.int64, max_size=latency_window, path=latency_path)
+        self._scores = _SampleBuffer(np.float64, max_size=max_samples, path=scores_path)
+        self.domain_coverage = Counter()
+        self.chunk_hits = Counter()
+        # Sample-derived statistics cached by generate_report(); recording latencies
+        # or scores, or reset(), marks them dirty
+        self._report_cache = None
+        self._dirty = True
+
+    @staticmethod
+    def _new_sample_file(storage_dir: str, prefix: str) -> str:
+        """Create an empty, uniquely named sample file in storage_dir and return its path."""
+        fd, path = tempfile.mkstemp(prefix=prefix, suffix=".bin", dir=storage_dir)
+        os.close(fd)
+        return path
+
+    def _new_p2_quantiles(self) -> Dict[str, _P2Quantile]:
+        """Fresh P-square estimators for the reported percentiles, if enabled."""
+        if self.latency_estimator != "p2":
+            return {}
+        return {"p50": _P2Quantile(0.50), "p95": _P2Quantile(0.95), "p99": _P2Quantile(0.99)}
+
+    @property
+    def total_latency(self) -> float:
+        """Sum of all recorded latencies in milliseconds."""
+        return self._total_latency_ns / _NS_PER_MS
+
+    @property
+    def latencies(self) -> np.ndarray:
+        """Stored query latencies in milliseconds (see max_samples and keep_latency_samples)."""
+        return self._latencies.view() / _NS_PER_MS
+
+    @property
+    def relevance_scores(self) -> np.ndarray:
+        """Recorded relevance (similarity) scores as a contiguous float64 view."""
+        return self._scores.view()
+        
+    def _update_latency_estimators(self, latency_ns: int):
+        """Feed one latency into the streaming P-square / HDR estimators, if enabled."""
+        for estimator in self._p2_quantiles.values():
+            estimator.update(latency_ns)
+        if self._hdr is not None:
+            self._hdr.record_value(min(latency_ns // 1000, _HDR_HIGHEST_US))
         
     def record_query_latency(self, latency_ms: float):
-        """Record query retrieval latency."""
-        self.latencies.append(latency_ms)
-        self.total_latency += latency_ms
+        """
+        Record query retrieval latency.
+        Latencies are kept as integer nanoseconds, so NaN and infinity raise ValueError.
+        """
+        if not math.isfinite(latency_ms):
+            raise ValueError(f"Latency must be a finite number of milliseconds, got {latency_ms}")
+        self.record_query_latency_ns(round(latency_ms * _NS_PER_MS))
+        
+    def record_query_latency_ns(self, latency_ns: int):
+        """Record query retrieval latency in integer nanoseconds (e.g. a time.perf_counter_ns() delta)."""
+        if self._sorted_latencies is not None:
+            evicted = self._latencies.next_evicted()
+            if evicted is not None:
+                del self._sorted_latencies[bisect.bisect_left(self._sorted_latencies, evicted)]
+            bisect.insort(self._sorted_latencies, latency_ns)
+        self._latencies.append_one(latency_ns)
+        self._update_latency_estimators(latency_ns)
+        self._total_latency_ns += latency_ns
         self.query_count += 1
+        self._dirty = True
+        
+    def record_query_latencies(self, latencies_ms: List[float]):
+        """Record many query latencies (ms) with one vectorized append."""
+        latencies_ms = np.asarray(latencies_ms, dtype=np.float64)
+        if not np.isfinite(latencies_ms).all():
+            raise ValueError("Latencies must be finite numbers of milliseconds")
+        latencies_ns = np.rint(latencies_ms * _NS_PER_MS).astype(np.int64)
+        self._latencies.append(latencies_ns)
+        if self._p2_quantiles or self._hdr is not None:
+            for latency_ns in latencies_ns.tolist():
+                self._update_latency_estimators(latency_ns)
+        if self._sorted_latencies is not None:
+            if self._latencies.max_size is None:
+                merged = np.concatenate((np.frombuffer(self._sorted_latencies, dtype=np.int64), latencies_ns))
+            else:
+                # The ring may have dropped older samples; re-sort what it still holds
+                merged = self._latencies.view().copy()
+            merged.sort(kind="stable")
+            self._sorted_latencies = array("q", merged.tobytes())
+        self._total_latency_ns += int(latencies_ns.sum())
+        self.query_count += latencies_ns.size
+        self._dirty = True
         
     def record_relevance_scores(self, distances: List[float]):
         """Record relevance scores (cosine distances) from search results."""
         # Convert distance to similarity (1 - distance for cosine)
-        similarities = [1 - d for d in distances]
-        self.relevance_scores.extend(similarities)
+        self.record_similarity_scores(np.subtract(1.0, np.asarray(distances, dtype=np.float64)))
+        
+    def record_relevance_scores_batch(self, distances: List[List[float]]):
+        """Record cosine distances from many result sets (2D or ragged) in one append."""
+        if isinstance(distances, np.ndarray):
+            flat = distances.astype(np.float64, copy=False).ravel()
+        else:
+            flat = np.fromiter(chain.from_iterable(distances), dtype=np.float64)
+        self.record_relevance_scores(flat)
+        
+    def record_similarity_scores(self, similarities: List[float]):
+        """Record relevance scores already converted to similarities (e.g. SearchResult.similarities)."""
+        self._scores.append(similarities)
+        self._dirty = True
         
     def record_domain_hit(self, domain_name: str, chunk_count: int = 1):
         """Record hit on a specific domain."""
@@ -45,53 +540,88 @@ class RetrievalMetrics:
         """Record that a specific chunk was retrieved."""
         self.chunk_hits[chunk_id] += 1
         
+    def record_chunk_hits(self, chunk_ids: List[str]):
+        """Record many chunk retrievals with one Counter update."""
+        self.chunk_hits.update(chunk_ids)
+        
     def get_average_latency(self) -> float:
         """Get average retrieval latency in milliseconds."""
         if self.query_count == 0:
             return 0
-        return self.total_latency / self.query_count
+        return self._total_latency_ns / self.query_count / _NS_PER_MS
     
     def get_latency_percentiles(self) -> Dict[str, float]:
         """Get latency percentiles."""
-        if not self.latencies:
+        if self.query_count == 0:
             return {}
+        # Exact percentiles over the stored samples while P-square is still warming up
+        if self._p2_quantiles and self.query_count >= _P2_MIN_SAMPLES:
+            estimates = {
+                name: estimator.value() / _NS_PER_MS for name, estimator in self._p2_quantiles.items()
+            }
+            # P-square's outer markers are the exact extremes
+            estimates["min"] = self._p2_quantiles["p50"].min() / _NS_PER_MS
+            estimates["max"] = self._p2_quantiles["p50"].max() / _NS_PER_MS
+            return estimates
+        if self._hdr is not None:
+            # One walk over the fixed bucket array, independent of sample count
+            return {
+                "p50": self._hdr.get_value_at_percentile(50) / 1000,
+                "p95": self._hdr.get_value_at_percentile(95) / 1000,
+                "p99": self._hdr.get_value_at_percentile(99) / 1000,
+                "min": self._hdr.get_min_value() / 1000,
+                "max": self._hdr.get_max_value() / 1000
+            }
+        if self._sorted_latencies is not None:
+            # Direct index reads with the same linear interpolation as np.percentile
+            ordered = self._sorted_latencies
+            return {
+                "p50": _sorted_percentile(ordered, 50) / _NS_PER_MS,
+                "p95": _sorted_percentile(ordered, 95) / _NS_PER_MS,
+                "p99": _sorted_percentile(ordered, 99) / _NS_PER_MS,
+                "min": ordered[0] / _NS_PER_MS,
+                "max": ordered[-1] / _NS_PER_MS
+            }
+        latencies = self._latencies.view()
+        # One call sorts once for all three quantiles
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99], method="linear")
         return {
-            "p50": np.percentile(self.latencies, 50),
-            "p95": np.percentile(self.latencies, 95),
-            "p99": np.percentile(self.latencies, 99),
-            "min": min(self.latencies),
-            "max": max(self.latencies)
+            "p50": float(p50) / _NS_PER_MS,
+            "p95": float(p95) / _NS_PER_MS,
+            "p99": float(p99) / _NS_PER_MS,
+            "min": int(latencies.min()) / _NS_PER_MS,
+            "max": int(latencies.max()) / _NS_PER_MS
         }
     
     def get_average_relevance_score(self) -> float:
         """Get average relevance (similarity) score."""
-        if not self.relevance_scores:
+        if len(self._scores) == 0:
             return 0
-        return np.mean(self.relevance_scores)
+        return float(np.mean(self.relevance_scores))
     
     def get_top_k_precision(self, k: int = 5, threshold: float = 0.6) -> float:
         """
         Calculate Top-K Precision.
         Percentage of top-k results with relevance above threshold.
         """
-        if not self.relevance_scores or len(self.relevance_scores) < k:
+        if len(self._scores) == 0 or len(self._scores) < k:
             return 0
-        top_k_scores = sorted(self.relevance_scores, reverse=True)[:k]
-        relevant_count = sum(1 for score in top_k_scores if score > threshold)
-        return relevant_count / k
+        scores = self.relevance_scores
+        # Partial selection of the k largest scores - no full sort needed
+        top_k_scores = scores[np.argpartition(-scores, k - 1)[:k]]
+        return float((top_k_scores > threshold).mean())
     
     def get_mean_reciprocal_rank(self, threshold: float = 0.6) -> float:
         """
         Calculate Mean Reciprocal Rank (MRR).
         Average of reciprocal ranks of first relevant result.
         """
-        if not self.relevance_scores:
+        if len(self._scores) == 0:
             return 0
-        
-        sorted_scores = sorted(self.relevance_scores, reverse=True)
-        for rank, score in enumerate(sorted_scores, 1):
-            if score > threshold:
-                return 1 / rank
+        # In descending order the first relevant score is at rank 1 exactly
+        # when the best score clears the threshold, otherwise none do.
+        if self.relevance_scores.max() > threshold:
+            return 1.0
         return 0  # No relevant results found
     
     def get_domain_coverage(self) -> Dict[str, float]:
@@ -99,21 +629,17 @@ class RetrievalMetrics:
         Get domain coverage distribution.
         Returns percentage of retrievals per domain.
         """
-        total_hits = sum(self.domain_coverage.values())
+        hits = np.fromiter(self.domain_coverage.values(), dtype=np.float64, count=len(self.domain_coverage))
+        total_hits = hits.sum()
         if total_hits == 0:
             return {}
-        return {
-            domain: (hits / total_hits) * 100 
-            for domain, hits in self.domain_coverage.items()
-        }
+        # One multiply by the precomputed reciprocal instead of a divide per domain
+        percentages = hits * (100.0 / total_hits)
+        return dict(zip(self.domain_coverage.keys(), percentages.tolist()))
     
     def get_chunk_hit_distribution(self, top_n: int = 10) -> Dict[str, int]:
         """Get most frequently retrieved chunks."""
-        return dict(sorted(
-            self.chunk_hits.items(),
-            key=lambda x: x[1],
-            reverse=True
-        )[:top_n])
+        return dict(self.chunk_hits.most_common(top_n))
     
     def get_retrieval_coverage(self, total_chunks: int) -> float:
         """
@@ -125,23 +651,40 @@ class RetrievalMetrics:
         unique_chunks_hit = len(self.chunk_hits)
         return (unique_chunks_hit / total_chunks) * 100
     
-    def get_context_coherence(self, retrieved_distances: List[List[float]]) -> float:
+    def _mean_row_similarity(self, retrieved_distances: List[List[float]]) -> float:
         """
-        Calculate context coherence.
-        Average similarity between retrieved chunks (how well they relate).
+        Mean over result sets of the average similarity within each set.
+        Result sets with fewer than two chunks are ignored.
         """
-        if not retrieved_distances or len(retrieved_distances) == 0:
+        if retrieved_distances is None or len(retrieved_distances) == 0:
             return 0
         
-        coherences = []
-        for distances in retrieved_distances:
-            if len(distances) > 1:
-                # Average of all pairwise similarities in result set
-                similarities = [1 - d for d in distances]
-                coherence = np.mean(similarities)
-                coherences.append(coherence)
+        try:
+            distances = np.asarray(retrieved_distances, dtype=np.float64)
+        except ValueError:
+            distances = None  # Ragged result sets
         
-        return np.mean(coherences) if coherences else 0
+        if distances is not None and distances.ndim == 2:
+            if distances.shape[1] <= 1:
+                return 0
+            return float(_mean_similarity(distances))
+        
+        # Ragged result sets: flatten once and reduce each row segment in place
+        rows = [row for row in retrieved_distances if len(row) > 1]
+        if not rows:
+            return 0
+        lengths = np.fromiter(map(len, rows), dtype=np.intp, count=len(rows))
+        flat = np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=int(lengths.sum()))
+        offsets = np.concatenate(([0], np.cumsum(lengths[:-1])))
+        row_means = np.add.reduceat(flat, offsets) / lengths
+        return float(1.0 - row_means.mean())
+    
+    def get_context_coherence(self, retrieved_distances: List[List[float]]) -> float:
+        """
+        Calculate context coherence.
+        Average similarity between retrieved chunks (how well they relate).
+        """
+        return self._mean_row_similarity(retrieved_distances)
     
     def get_redundancy_score(self, retrieved_distances: List[List[float]]) -> float:
         """
@@ -149,31 +692,42 @@ class RetrievalMetrics:
         Lower is better - indicates less duplicate/similar content.
         0 = no redundancy, 1 = high redundancy
         """
-        if not retrieved_distances or len(retrieved_distances) == 0:
-            return 0
-        
-        redundancies = []
-        for distances in retrieved_distances:
-            if len(distances) > 1:
-                similarities = [1 - d for d in distances]
-                # High similarity = high redundancy
-                redundancy = np.mean(similarities)
-                redundancies.append(redundancy)
-        
-        return np.mean(redundancies) if redundancies else 0
+        # High similarity = high redundancy
+        return self._mean_row_similarity(retrieved_distances)
     
     def generate_report(self) -> Dict[str, Any]:
-        """Generate comprehensive evaluation report."""
+        """
+        Generate comprehensive evaluation report.
+        Latency percentiles and relevance metrics are cached and only recomputed after
+        new samples are recorded or on reset; every call returns freshly built dicts,
+        so callers may modify the report.
+        """
+        if self._dirty:
+            if len(self._scores) == 0:
+                relevance_summary = (0, 0, 0)
+            else:
+                # Top-5 precision and MRR in one pass over the scores. The threshold takes
+                # the scores' dtype so the compiled kernel compares exactly like
+                # get_top_k_precision() and get_mean_reciprocal_rank(); the mean comes
+                # from the same np.mean as get_average_relevance_score().
+                scores = self.relevance_scores
+                top_5_precision, mrr = _relevance_summary(scores, 5, scores.dtype.type(0.6))
+                relevance_summary = (self.get_average_relevance_score(), float(top_5_precision), float(mrr))
+            self._report_cache = (self.get_latency_percentiles(), relevance_summary)
+            self._dirty = False
+        
+        latency_percentiles, (average_relevance, top_5_precision, mrr) = self._report_cache
+        # Counters are public and may be written directly, so coverage is always recomputed
         return {
             "query_statistics": {
                 "total_queries": self.query_count,
                 "average_latency_ms": self.get_average_latency(),
-                "latency_percentiles": self.get_latency_percentiles()
+                "latency_percentiles": dict(latency_percentiles)
             },
             "relevance_metrics": {
-                "average_relevance_score": self.get_average_relevance_score(),
-                "top_5_precision": self.get_top_k_precision(k=5),
-                "mean_reciprocal_rank": self.get_mean_reciprocal_rank()
+                "average_relevance_score": average_relevance,
+                "top_5_precision": top_5_precision,
+                "mean_reciprocal_rank": mrr
             },
             "coverage_metrics": {
                 "domain_coverage": self.get_domain_coverage(),
@@ -186,13 +740,31 @@ class RetrievalMetrics:
         }
     
     def reset(self):
-        """Reset all metrics."""
+        """Reset all metrics, reusing the allocated buffers and containers."""
         self.query_count = 0
-        self.total_latency = 0
-        self.latencies = []
-        self.relevance_scores = []
-        self.domain_coverage = defaultdict(int)
-        self.chunk_hits = defaultdict(int)
+        self._total_latency_ns = 0
+        self._latencies.clear()
+        self._scores.clear()
+        for estimator in self._p2_quantiles.values():
+            estimator.reset()
+        if self._hdr is not None:
+            self._hdr.reset()
+        if self._sorted_latencies is not None:
+            del self._sorted_latencies[:]
+        self.domain_coverage.clear()
+        self.chunk_hits.clear()
+        self._dirty = True
+    
+    def close(self):
+        """Delete the memory-mapped sample files, if any. The instance must not be used afterwards."""
+        if self._finalizer is not None:
+            self._finalizer()
+    
+    def release_memory(self):
+        """Reset all metrics and free sample storage grown beyond its initial size."""
+        self.reset()
+        self._latencies.release()
+        self._scores.release()
 
 
 class RetrievalBenchmark:
@@ -210,7 +782,69 @@ class RetrievalBenchmark:
         """
         self.test_queries = test_queries
         self.expected_relevant_domains = expected_relevant_domains
-        self.results = []
+        # Domains are encoded as bits so set intersection is one AND + popcount.
+        # Labels outside DOMAIN_CONFIG get the next free bit on first use.
+        self._domain_ids = dict(DOMAIN_IDS)
+        self._expected_masks = {
+            query_idx: self._domain_mask(domains)
+            for query_idx, domains in expected_relevant_domains.items()
+        }
+        self._expected_counts = {
+            query_idx: mask.bit_count() for query_idx, mask in self._expected_masks.items()
+        }
+        # Same expectations as a (queries x domains) matrix for evaluate_all
+        self._expected_matrix = self._domain_matrix(
+            [expected_relevant_domains.get(query_idx, []) for query_idx in range(len(test_queries))]
+        )
+        # Numeric scores live in one structured array; non-numeric fields in a parallel list
+        self._results = np.empty(64, dtype=_RESULT_DTYPE)
+        self._query_indices = []
+        self._n = 0
+
+    @property
+    def results(self) -> List[Dict[str, Any]]:
+        """Per-query evaluations recorded so far."""
+        return [
+            {
+                "query_idx": query_idx,
+                "query": self.test_queries[query_idx],
+                "precision": float(row["precision"]),
+                "recall": float(row["recall"]),
+                "f1_score": float(row["f1"]),
+                "average_relevance": float(row["relevance"])
+            }
+            for query_idx, row in zip(self._query_indices, self._results[:self._n])
+        ]
+    
+    def _domain_id(self, domain: str) -> int:
+        """Bit position of a domain, registering unseen domains on first use."""
+        bit = self._domain_ids.get(domain)
+        if bit is None:
+            bit = self._domain_ids[domain] = len(self._domain_ids)
+        return bit
+    
+    def _domain_mask(self, domains: List[str]) -> int:
+        """Encode a collection of domain names as a bitmap."""
+        domain_ids = self._domain_ids
+        mask = 0
+        for domain in domains:
+            # Known domains take the plain dict lookup; only new ones pay for registration
+            bit = domain_ids.get(domain)
+            if bit is None:
+                bit = self._domain_id(domain)
+            mask |= 1 << bit
+        return mask
+    
+    def _domain_matrix(self, domains_per_query: List[List[str]]) -> np.ndarray:
+        """Encode domains per query as a (queries x domains) boolean matrix."""
+        rows, cols = [], []
+        for query_idx, domains in enumerate(domains_per_query):
+            for domain in domains:
+                rows.append(query_idx)
+                cols.append(self._domain_id(domain))
+        matrix = np.zeros((len(domains_per_query), len(self._domain_ids)), dtype=bool)
+        matrix[rows, cols] = True
+        return matrix
     
     def evaluate_query(self, query_idx: int, retrieved_domains: List[str], 
                       relevance_scores: List[float]) -> Dict[str, Any]:
@@ -220,19 +854,21 @@ class RetrievalBenchmark:
         Returns:
             Evaluation metrics for the query
         """
-        expected = set(self.expected_relevant_domains.get(query_idx, []))
-        retrieved = set(retrieved_domains)
+        expected = self._expected_masks.get(query_idx, 0)
+        expected_count = self._expected_counts.get(query_idx, 0)
+        retrieved = self._domain_mask(retrieved_domains)
+        matched = (expected & retrieved).bit_count()
         
         # Calculate precision and recall
-        if len(retrieved) == 0:
+        if retrieved == 0:
             precision = 0
         else:
-            precision = len(expected & retrieved) / len(retrieved)
+            precision = matched / retrieved.bit_count()
         
-        if len(expected) == 0:
+        if expected_count == 0:
             recall = 1.0
         else:
-            recall = len(expected & retrieved) / len(expected)
+            recall = matched / expected_count
         
         # Calculate F1 score
         if precision + recall == 0:
@@ -249,18 +885,88 @@ class RetrievalBenchmark:
             "average_relevance": np.mean(relevance_scores) if relevance_scores else 0
         }
         
-        self.results.append(evaluation)
+        if self._n == self._results.size:
+            self._results = np.resize(self._results, self._n * 2)
+        self._results[self._n] = (precision, recall, f1, evaluation["average_relevance"])
+        self._query_indices.append(query_idx)
+        self._n += 1
         return evaluation
     
+    def evaluate_all(self, retrieved_per_query: List[List[str]],
+                     scores_per_query: List[List[float]]) -> Dict[str, np.ndarray]:
+        """
+        Evaluate every test query in one vectorized pass.
+        
+        Args:
+            retrieved_per_query: Retrieved domains for each test query, in test_queries order
+            scores_per_query: Relevance scores for each test query, in test_queries order
+        
+        Returns:
+            Arrays of per-query 'precision', 'recall', 'f1_score' and 'average_relevance'
+        """
+        n_queries = len(self.test_queries)
+        if len(retrieved_per_query) != n_queries:
+            raise ValueError(
+                f"retrieved_per_query has {len(retrieved_per_query)} entries, "
+                f"expected one per test query ({n_queries})"
+            )
+        if len(scores_per_query) != n_queries:
+            raise ValueError(
+                f"scores_per_query has {len(scores_per_query)} entries, "
+                f"expected one per test query ({n_queries})"
+            )
+        retrieved = self._domain_matrix(retrieved_per_query)
+        # Widen the precomputed expectations for domains first seen after __init__
+        expected = self._expected_matrix
+        expected = np.pad(expected, ((0, 0), (0, retrieved.shape[1] - expected.shape[1])))
+        
+        matched = (expected & retrieved).sum(axis=1)
+        retrieved_counts = retrieved.sum(axis=1)
+        expected_counts = expected.sum(axis=1)
+        precision = np.divide(matched, retrieved_counts, out=np.zeros(n_queries), where=retrieved_counts > 0)
+        recall = np.divide(matched, expected_counts, out=np.ones(n_queries), where=expected_counts > 0)
+        f1 = np.divide(2 * precision * recall, precision + recall,
+                       out=np.zeros(n_queries), where=(precision + recall) > 0)
+        
+        lengths = np.fromiter(map(len, scores_per_query), dtype=np.intp, count=n_queries)
+        flat_scores = np.fromiter(chain.from_iterable(scores_per_query), dtype=np.float64,
+                                  count=int(lengths.sum()))
+        score_sums = np.bincount(np.repeat(np.arange(n_queries), lengths),
+                                 weights=flat_scores, minlength=n_queries)
+        average_relevance = np.divide(score_sums, lengths, out=np.zeros(n_queries), where=lengths > 0)
+        
+        # Record into the results array in one slice assignment per field
+        end = self._n + n_queries
+        if end > self._results.size:
+            capacity = self._results.size
+            while capacity < end:
+                capacity *= 2
+            self._results = np.resize(self._results, capacity)
+        results = self._results[self._n:end]
+        results["precision"] = precision
+        results["recall"] = recall
+        results["f1"] = f1
+        results["relevance"] = average_relevance
+        self._query_indices.extend(range(n_queries))
+        self._n = end
+        
+        return {
+            "precision": precision,
+            "recall": recall,
+            "f1_score": f1,
+            "average_relevance": average_relevance
+        }
+    
     def get_benchmark_summary(self) -> Dict[str, float]:
         """Get summary statistics across all evaluations."""
-        if not self.results:
+        if self._n == 0:
             return {}
         
+        results = self._results[:self._n]
         return {
-            "mean_precision": np.mean([r["precision"] for r in self.results]),
-            "mean_recall": np.mean([r["recall"] for r in self.results]),
-            "mean_f1": np.mean([r["f1_score"] for r in self.results]),
-            "mean_relevance": np.mean([r["average_relevance"] for r in self.results]),
-            "queries_evaluated": len(self.results)
+            "mean_precision": float(results["precision"].mean()),
+            "mean_recall": float(results["recall"].mean()),
+            "mean_f1": float(results["f1"].mean()),
+            "mean_relevance": float(results["relevance"].mean()),
+            "queries_evaluated": self._n
         }
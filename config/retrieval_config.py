@@ -5,6 +5,8 @@ This module contains all configurable parameters for the RAG retrieval system,
 including chunking strategies, embedding models, and performance optimization settings.
 """
 
+from functools import cache
+
 # Text Chunking Configuration
 CHUNK_CONFIG = {
     "chunk_size": 500,                    # Characters per chunk
@@ -117,44 +119,82 @@ LLM_CONFIG = {
 }
 
 
+class _FrozenDict(dict):
+    """
+    Read-only dict returned by the config getters.
+
+    Still a dict, so it serialises to JSON like before; copying or pickling it
+    yields plain dicts that the caller may modify.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Configuration is read-only; use the update_* functions to change it")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+
+def _freeze(value):
+    """Deep read-only snapshot of a config value: dicts become _FrozenDict, lists tuples."""
+    if isinstance(value, dict):
+        return _FrozenDict((key, _freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+# Getters return cached, deeply frozen snapshots; update_* functions clear the
+# cache of the getter they affect so the next call sees the new value.
+
+@cache
 def get_chunk_config():
     """Get text chunking configuration."""
-    return CHUNK_CONFIG
+    return _freeze(CHUNK_CONFIG)
 
 
+@cache
 def get_vectordb_config():
     """Get vector database configuration."""
-    return VECTORDB_CONFIG
+    return _freeze(VECTORDB_CONFIG)
 
 
+@cache
 def get_search_config():
     """Get search/retrieval configuration."""
-    return SEARCH_CONFIG
+    return _freeze(SEARCH_CONFIG)
 
 
+@cache
 def get_metrics_config():
     """Get performance metrics configuration."""
-    return METRICS_CONFIG
+    return _freeze(METRICS_CONFIG)
 
 
+@cache
 def get_domain_config():
     """Get domain configuration."""
-    return DOMAIN_CONFIG
+    return _freeze(DOMAIN_CONFIG)
 
 
+@cache
 def get_interview_config():
     """Get interview configuration."""
-    return INTERVIEW_CONFIG
+    return _freeze(INTERVIEW_CONFIG)
 
 
+@cache
 def get_llm_config():
     """Get LLM provider configuration."""
-    return LLM_CONFIG
+    return _freeze(LLM_CONFIG)
 
 
 def update_chunk_size(new_size: int):
     """Update chunk size dynamically."""
     CHUNK_CONFIG["chunk_size"] = new_size
+    get_chunk_config.cache_clear()
     print(f"Chunk size updated to {new_size}")
 
 
@@ -165,4 +205,5 @@ def update_top_k(new_top_k: int):
         SEARCH_CONFIG["default_top_k"] = SEARCH_CONFIG["max_top_k"]
     else:
         SEARCH_CONFIG["default_top_k"] = new_top_k
+    get_search_config.cache_clear()
     print(f"Default top-k updated to {SEARCH_CONFIG['default_top_k']}")
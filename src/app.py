@@ -165,6 +165,7 @@ Answer: """
             search_results = self.vector_db.search(search_context, n_results)
             
             if not search_results["documents"]:
+                self.vector_db.release(search_results)
                 return "I apologize, but I couldn't find any relevant information in my knowledge base to answer your question."
             
             # Combine retrieved chunks into context
@@ -174,6 +175,9 @@ Answer: """
                 source = meta.get("source", "Unknown source")
                 context_chunks.append(f"[Document {i+1} from {source}]:\n{doc}\n")
             
+            # Results are no longer needed once the context is built
+            self.vector_db.release(search_results)
+            
             # Join all context chunks with clear separation
             context = "\n".join(context_chunks)
             
@@ -1,14 +1,82 @@
 import os
 import chromadb
+import numpy as np
+import torch
+from collections import OrderedDict
+from collections.abc import Mapping
 from typing import List, Dict, Any
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 from sentence_transformers import SentenceTransformer
 
 
+# Shared read-only placeholders so clearing a pooled SearchResult allocates nothing
+_NO_RESULTS = ()
+_NO_SIMILARITIES = np.empty(0, dtype=np.float32)
+_NO_SIMILARITIES.flags.writeable = False
+
+
+class SearchResult(Mapping):
+    """
+    Results of a single similarity search.
+
+    A read-only Mapping over the result fields, so result["documents"], .get(),
+    keys() and `in` behave as they did on the plain result dictionary. It is not a
+    dict subclass: use as_dict() where a real dict is needed (e.g. JSON
+    serialisation). Instances are pooled by VectorDB; hand them back with
+    VectorDB.release() once they are no longer needed.
+    """
+
+    _FIELDS = ("documents", "metadatas", "distances", "similarities", "ids")
+    # _pooled is True while the instance sits in a VectorDB free list
+    __slots__ = _FIELDS + ("_pooled",)
+
+    def __init__(self):
+        self._pooled = False
+        self.clear()
+
+    def clear(self) -> None:
+        """Reset all fields to shared empty placeholders."""
+        self.documents = _NO_RESULTS
+        self.metadatas = _NO_RESULTS
+        self.distances = _NO_RESULTS
+        self.similarities = _NO_SIMILARITIES
+        self.ids = _NO_RESULTS
+
+    def __getitem__(self, key: str) -> List[Any]:
+        if key not in self._FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self._FIELDS)
+
+    def __len__(self) -> int:
+        return len(self._FIELDS)
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the results as a plain dictionary."""
+        return {
+            "documents": self.documents,
+            "metadatas": self.metadatas,
+            "distances": self.distances,
+            "similarities": self.similarities,
+            "ids": self.ids
+        }
+
+
 class VectorDB:
     """
     A simple vector database wrapper using ChromaDB with HuggingFace embeddings.
     """
 
+    # Maximum number of query embeddings kept in the LRU cache
+    QUERY_CACHE_SIZE = 512
+    # Maximum number of released SearchResult objects kept for reuse
+    RESULT_POOL_SIZE = 64
+
+    # Number of chunks encoded per forward pass
+    EMBEDDING_BATCH_SIZE = 64
+
     def __init__(self, collection_name: str = None, embedding_model: str = None):
         """
         Initialize the vector database.
@@ -29,16 +97,90 @@ class VectorDB:
 
         # Load embedding model
         print(f"Loading embedding model: {self.embedding_model_name}")
-        self.embedding_model = SentenceTransformer(self.embedding_model_name)
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.embedding_model = None
+        if os.getenv("USE_ONNX_INT8") == "1":
+            self.embedding_model = self._load_onnx_int8_model()
+        if self.embedding_model is None:
+            self.embedding_model = SentenceTransformer(self.embedding_model_name, device=self.device)
+            if self.device == "cuda":
+                # Half precision halves memory traffic and uses tensor cores on GPU
+                self.embedding_model.half()
 
-        # Get or create collection
-        self.collection = self.client.get_or_create_collection(
-            name=self.collection_name,
-            metadata={"description": "RAG document collection"},
-        )
+        # LRU cache of query embeddings keyed by query text
+        self._query_cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+
+        # Text splitters are reused across documents, one per chunk size
+        self._splitters: Dict[int, RecursiveCharacterTextSplitter] = {}
+
+        # Free list of SearchResult objects returned through release()
+        self._result_pool: List[SearchResult] = []
+
+        # Get or create collection; embeddings are unit-normalized, so use a cosine
+        # HNSW index whose distances convert to similarity as 1 - distance
+        self.collection = self._get_or_create_cosine_collection()
+
+        # Cached chunk count; the collection only changes through add_documents
+        self._count = self.collection.count()
 
         print(f"Vector database initialized with collection: {self.collection_name}")
 
+    def _get_or_create_cosine_collection(self):
+        """
+        Open the collection, rebuilding it with a cosine index if it was created
+        with another distance space.
+
+        hnsw:space is fixed when a collection is created, so a store written with
+        Chroma's default L2 index would otherwise keep returning L2 distances and
+        1 - distance would no longer be a similarity.
+        """
+        metadata = {"hnsw:space": "cosine", "description": "RAG document collection"}
+        collection = self.client.get_or_create_collection(name=self.collection_name, metadata=metadata)
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        if space == "cosine":
+            return collection
+
+        print(f"Collection {self.collection_name} uses '{space}' distances; rebuilding with a cosine index...")
+        existing = collection.get(include=["documents", "metadatas"])
+        self.client.delete_collection(name=self.collection_name)
+        collection = self.client.create_collection(name=self.collection_name, metadata=metadata)
+        if existing["ids"]:
+            collection.add(
+                embeddings=self._embed_chunks(existing["documents"]),
+                documents=existing["documents"],
+                metadatas=existing["metadatas"],
+                ids=existing["ids"]
+            )
+        print(f"Rebuilt {len(existing['ids'])} chunks with a cosine index")
+        return collection
+
+    def count(self) -> int:
+        """Number of chunks stored in the collection."""
+        return self._count
+
+    def _load_onnx_int8_model(self):
+        """
+        Load an int8-quantized ONNX export of the embedding model for CPU inference.
+        Requires optimum[onnxruntime]; returns None so the caller can fall back to
+        the default PyTorch backend if the export cannot be loaded.
+        """
+        file_name = os.getenv("ONNX_MODEL_FILE", "onnx/model_qint8_avx512_vnni.onnx")
+        try:
+            model = SentenceTransformer(
+                self.embedding_model_name,
+                device="cpu",
+                backend="onnx",
+                model_kwargs={
+                    "file_name": file_name,
+                    "provider": "CPUExecutionProvider"
+                }
+            )
+            print(f"Using int8 ONNX embedding backend: {file_name}")
+            return model
+        except Exception as e:
+            print(f"Could not load int8 ONNX model, falling back to PyTorch: {str(e)}")
+            return None
+
     def chunk_text(self, text: str, chunk_size: int = 500) -> List[str]:
         """
         Split text into smaller chunks using LangChain's RecursiveCharacterTextSplitter.
@@ -51,15 +193,16 @@ class VectorDB:
         Returns:
             List of text chunks
         """
-        from langchain_text_splitters import RecursiveCharacterTextSplitter
-        
-        # Initialize the text splitter with appropriate parameters
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=50,  # Overlap between chunks to maintain context
-            length_function=len,
-            separators=["\n\n", "\n", ". ", ", ", " ", ""]  # Order from most to least preferred split points
-        )
+        text_splitter = self._splitters.get(chunk_size)
+        if text_splitter is None:
+            # Initialize the text splitter with appropriate parameters
+            text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size,
+                chunk_overlap=50,  # Overlap between chunks to maintain context
+                length_function=len,
+                separators=["\n\n", "\n", ". ", ", ", " ", ""]  # Order from most to least preferred split points
+            )
+            self._splitters[chunk_size] = text_splitter
         
         try:
             # Split the text into chunks
@@ -71,6 +214,56 @@ class VectorDB:
             # Return single chunk if splitting fails
             return [text]
 
+    def _embed_query(self, query: str) -> np.ndarray:
+        """
+        Embed a query, reusing the cached embedding for repeated queries.
+
+        Args:
+            query: Search query
+
+        Returns:
+            Normalized query embedding
+        """
+        embedding = self._query_cache.get(query)
+        if embedding is not None:
+            self._query_cache.move_to_end(query)
+            return embedding
+
+        embedding = self.embedding_model.encode(
+            [query],
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False
+        )[0]
+        self._query_cache[query] = embedding
+        if len(self._query_cache) > self.QUERY_CACHE_SIZE:
+            # Evict the least recently used query
+            self._query_cache.popitem(last=False)
+        return embedding
+
+    def _embed_chunks(self, chunks: List[str]) -> np.ndarray:
+        """
+        Embed chunks batch by batch into one preallocated float32 matrix.
+
+        Args:
+            chunks: Text chunks to embed
+
+        Returns:
+            Array of shape (len(chunks), embedding_dim) with normalized rows
+        """
+        dim = self.embedding_model.get_sentence_embedding_dimension()
+        embeddings = np.empty((len(chunks), dim), dtype=np.float32)
+        batch_size = self.EMBEDDING_BATCH_SIZE
+        for start in range(0, len(chunks), batch_size):
+            embeddings[start:start + batch_size] = self.embedding_model.encode(
+                chunks[start:start + batch_size],
+                batch_size=batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+        return embeddings
+
     def add_documents(self, documents: List[Dict[str, Any]]) -> None:
         """
         Add documents to the vector database.
@@ -100,18 +293,20 @@ class VectorDB:
                 print(f"Document {doc_idx}: Split into {len(chunks)} chunks")
                 
                 # Process each chunk
+                id_prefix = f"doc_{doc_idx}_chunk_"
+                total_chunks = len(chunks)
                 for chunk_idx, chunk in enumerate(chunks):
                     # Create unique ID for the chunk
-                    chunk_id = f"doc_{doc_idx}_chunk_{chunk_idx}"
+                    chunk_id = id_prefix + str(chunk_idx)
                     
-                    # Add chunk-specific metadata
-                    chunk_metadata = metadata.copy()
-                    chunk_metadata.update({
+                    # Add chunk-specific metadata in a single dict build
+                    chunk_metadata = {
+                        **metadata,
                         'chunk_id': chunk_id,
                         'chunk_index': chunk_idx,
-                        'total_chunks': len(chunks),
+                        'total_chunks': total_chunks,
                         'document_id': doc_idx
-                    })
+                    }
                     
                     # Add to lists for batch processing
                     all_chunks.append(chunk)
@@ -129,23 +324,50 @@ class VectorDB:
         try:
             # Generate embeddings for all chunks in one batch
             print("Generating embeddings for all chunks...")
-            embeddings = self.embedding_model.encode(all_chunks)
+            embeddings = self._embed_chunks(all_chunks)
             
-            # Add everything to ChromaDB
+            # Add everything to ChromaDB (accepts the NumPy array directly)
             print("Adding chunks to vector database...")
             self.collection.add(
-                embeddings=embeddings.tolist(),
+                embeddings=embeddings,
                 documents=all_chunks,
                 metadatas=all_metadatas,
                 ids=all_ids
             )
             
+            # Chroma skips ids it already holds, so re-read the size rather than adding
+            self._count = self.collection.count()
             print(f"Successfully added {len(all_chunks)} chunks to vector database")
             
         except Exception as e:
             print(f"Error adding chunks to database: {str(e)}")
 
-    def search(self, query: str, n_results: int = 5) -> Dict[str, Any]:
+    def _acquire_result(self) -> SearchResult:
+        """Take a SearchResult from the pool, or create one if the pool is empty."""
+        if self._result_pool:
+            result = self._result_pool.pop()
+            result._pooled = False
+            return result
+        return SearchResult()
+
+    def release(self, result: SearchResult) -> None:
+        """
+        Return a SearchResult to the pool for reuse by later searches.
+
+        Args:
+            result: Result previously returned by search(); must not be used afterwards
+
+        Releasing the same result twice is a no-op, and results beyond
+        RESULT_POOL_SIZE are left to the garbage collector.
+        """
+        if result._pooled:
+            return
+        result.clear()
+        if len(self._result_pool) < self.RESULT_POOL_SIZE:
+            result._pooled = True
+            self._result_pool.append(result)
+
+    def search(self, query: str, n_results: int = 5) -> SearchResult:
         """
         Search for similar documents in the vector database.
 
@@ -154,22 +376,17 @@ class VectorDB:
             n_results: Number of results to return
 
         Returns:
-            Dictionary containing search results with keys: 'documents', 'metadatas', 'distances', 'ids'
+            SearchResult with 'documents', 'metadatas', 'distances', 'similarities' and 'ids'
         """
+        result = self._acquire_result()
         try:
             # Check if collection is empty
-            if self.collection.count() == 0:
+            if self._count == 0:
                 print("Warning: Vector database is empty")
-                return {
-                    "documents": [],
-                    "metadatas": [],
-                    "distances": [],
-                    "ids": []
-                }
+                return result
 
-            # Generate embedding for the query
-            print("Generating query embedding...")
-            query_embedding = self.embedding_model.encode([query])[0]
+            # Generate (or reuse) embedding for the query
+            query_embedding = self._embed_query(query)
 
             # Perform the similarity search
             print(f"Searching for top {n_results} relevant chunks...")
@@ -179,35 +396,68 @@ class VectorDB:
                 include=["documents", "metadatas", "distances"]
             )
 
-            # Extract and format results
-            documents = results.get("documents", [[]])[0]  # Get first query's results
-            metadatas = results.get("metadatas", [[]])[0]
-            distances = results.get("distances", [[]])[0]
-            ids = results.get("ids", [[]])[0]
+            # Take first query's results - ChromaDB already orders them by distance
+            result.documents = results.get("documents", [[]])[0]
+            result.metadatas = results.get("metadatas", [[]])[0]
+            result.distances = results.get("distances", [[]])[0]
+            result.similarities = 1.0 - np.asarray(result.distances, dtype=np.float32)
+            result.ids = results.get("ids", [[]])[0]
 
-            # Sort results by distance (similarity score)
-            sorted_results = sorted(
-                zip(documents, metadatas, distances, ids),
-                key=lambda x: x[2]  # Sort by distance
+            print(f"Found {len(result.documents)} relevant chunks")
+            
+            return result
+
+        except Exception as e:
+            print(f"Error during similarity search: {str(e)}")
+            result.clear()
+            return result
+
+    def search_batch(self, queries: List[str], n_results: int = 5) -> List[SearchResult]:
+        """
+        Search for several queries with one embedding pass and one ChromaDB query.
+
+        Args:
+            queries: Search queries
+            n_results: Number of results to return per query
+
+        Returns:
+            One SearchResult per query, in the same order as queries
+        """
+        batch = [self._acquire_result() for _ in queries]
+        if not queries:
+            return batch
+
+        try:
+            if self._count == 0:
+                print("Warning: Vector database is empty")
+                return batch
+
+            # Encode all queries together, then let ChromaDB answer them in one call
+            query_embeddings = self.embedding_model.encode(
+                queries,
+                batch_size=self.EMBEDDING_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
+            print(f"Searching for top {n_results} relevant chunks for {len(queries)} queries...")
+            results = self.collection.query(
+                query_embeddings=query_embeddings,
+                n_results=n_results,
+                include=["documents", "metadatas", "distances"]
             )
 
-            # Unzip sorted results
-            sorted_docs, sorted_metas, sorted_dists, sorted_ids = zip(*sorted_results) if sorted_results else ([], [], [], [])
+            for i, result in enumerate(batch):
+                result.documents = results["documents"][i]
+                result.metadatas = results["metadatas"][i]
+                result.distances = results["distances"][i]
+                result.similarities = 1.0 - np.asarray(result.distances, dtype=np.float32)
+                result.ids = results["ids"][i]
 
-            print(f"Found {len(sorted_docs)} relevant chunks")
-            
-            return {
-                "documents": list(sorted_docs),
-                "metadatas": list(sorted_metas),
-                "distances": list(sorted_dists),
-                "ids": list(sorted_ids)
-            }
+            return batch
 
         except Exception as e:
-            print(f"Error during similarity search: {str(e)}")
-            return {
-                "documents": [],
-                "metadatas": [],
-                "distances": [],
-                "ids": []
-            }
+            print(f"Error during batch similarity search: {str(e)}")
+            for result in batch:
+                result.clear()
+            return batch
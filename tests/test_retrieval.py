@@ -4,12 +4,12 @@ Test suite for retrieval metrics and evaluation.
 Tests retrieval quality, performance metrics, and benchmark evaluation.
 """
 
-import sys
-import os
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import gc
+from collections import deque
+
+import pytest
 
 from config.metrics import RetrievalMetrics, RetrievalBenchmark
-import numpy as np
 
 
 def test_retrieval_metrics():
@@ -31,6 +31,103 @@ def test_retrieval_metrics():
     assert "p95" in percentiles
     assert "p99" in percentiles
     print("✓ Latency percentiles calculated correctly")
+    
+    # Non-finite latencies cannot be stored as integer nanoseconds
+    for invalid in (float("nan"), float("inf")):
+        with pytest.raises(ValueError):
+            metrics.record_query_latency(invalid)
+        with pytest.raises(ValueError):
+            metrics.record_query_latencies([1.0, invalid])
+    assert metrics.query_count == 3, "Rejected latencies should not be recorded"
+
+
+def test_sorted_latency_percentiles():
+    """Test the sorted estimator matches exact percentiles."""
+    latencies = [100.5, 150.2, 120.0, 98.7, 210.3, 133.1]
+
+    exact = RetrievalMetrics()
+    exact.record_query_latencies(latencies)
+
+    ordered = RetrievalMetrics(latency_estimator="sorted")
+    ordered.record_query_latencies(latencies[:3])
+    for latency in latencies[3:]:
+        ordered.record_query_latency(latency)
+
+    expected = exact.get_latency_percentiles()
+    for key, value in ordered.get_latency_percentiles().items():
+        assert abs(value - expected[key]) < 1e-9, f"{key} mismatch: {value} vs {expected[key]}"
+    
+    # With max_samples both estimators only see the latencies still in the ring
+    exact = RetrievalMetrics(max_samples=3)
+    ordered = RetrievalMetrics(max_samples=3, latency_estimator="sorted")
+    for metrics in (exact, ordered):
+        for latency in latencies:
+            metrics.record_query_latency(latency)
+        metrics.record_query_latencies([5.0, 300.0])
+        metrics.record_query_latency(42.0)
+    assert ordered.get_latency_percentiles() == exact.get_latency_percentiles()
+    assert ordered.get_latency_percentiles()["max"] == 300.0
+    print("✓ Sorted latency percentiles match exact percentiles")
+
+
+def test_p2_latency_percentiles():
+    """Test P-square estimates against exact percentiles for small and large sample counts."""
+    import numpy as np
+    rng = np.random.default_rng(7)
+    for latencies, tolerance in (([1, 2, 3, 4, 5], 1e-9),
+                                 (rng.lognormal(3, 0.5, 20).tolist(), 1e-9),
+                                 (rng.lognormal(3, 0.5, 20000).tolist(), 0.02)):
+        exact = RetrievalMetrics()
+        exact.record_query_latencies(latencies)
+        streaming = RetrievalMetrics(latency_estimator="p2")
+        for latency in latencies:
+            streaming.record_query_latency(latency)
+        
+        expected = exact.get_latency_percentiles()
+        for key, value in streaming.get_latency_percentiles().items():
+            assert abs(value - expected[key]) <= tolerance * expected[key], \
+                f"n={len(latencies)} {key}: {value} vs {expected[key]}"
+    
+    # A wrapped ring still reports exact percentiles over its samples during warm-up
+    latencies = rng.lognormal(3, 0.5, 101).tolist()
+    exact = RetrievalMetrics(max_samples=100)
+    streaming = RetrievalMetrics(max_samples=100, latency_estimator="p2")
+    for metrics in (exact, streaming):
+        metrics.record_query_latencies(latencies)
+    assert streaming.get_latency_percentiles() == exact.get_latency_percentiles()
+    
+    # Without max_samples only a bounded window of raw latencies is kept
+    streaming = RetrievalMetrics(latency_estimator="p2")
+    streaming.record_query_latencies(range(2000))
+    assert len(streaming.latencies) < 2000 and streaming.query_count == 2000
+    debug = RetrievalMetrics(latency_estimator="p2", keep_latency_samples=True)
+    debug.record_query_latencies(range(2000))
+    assert len(debug.latencies) == 2000
+    print("✓ P-square latency percentiles track exact percentiles")
+
+
+def test_hdr_latency_percentiles():
+    """Test HDR histogram percentiles stay within 3 significant figures of exact."""
+    pytest.importorskip("hdrh")
+    import numpy as np
+    rng = np.random.default_rng(11)
+    # 0.4us is below the 1us histogram resolution and is recorded as 0
+    latencies = [0.0004] + rng.lognormal(3, 0.5, 20000).tolist()
+    
+    exact = RetrievalMetrics()
+    exact.record_query_latencies(latencies)
+    histogram = RetrievalMetrics(latency_estimator="hdr")
+    histogram.record_query_latencies(latencies)
+    
+    expected = exact.get_latency_percentiles()
+    estimates = histogram.get_latency_percentiles()
+    for key, value in estimates.items():
+        # Relative error of 10^-3 plus one 1us bucket of absolute resolution
+        assert abs(value - expected[key]) <= 1e-3 * expected[key] + 1e-3, \
+            f"{key}: {value} vs {expected[key]}"
+    assert estimates["min"] == 0.0, "Sub-microsecond latencies should land in the zero bucket"
+    assert len(histogram.latencies) < len(latencies), "Raw latencies should not all be kept"
+    print("✓ HDR latency percentiles match exact percentiles")
 
 
 def test_relevance_metrics():
@@ -43,7 +140,8 @@ def test_relevance_metrics():
     
     # Average similarity should be high (1 - low distances)
     avg_relevance = metrics.get_average_relevance_score()
-    assert 0.8 < avg_relevance < 0.95, f"Expected 0.8-0.95, got {avg_relevance}"
+    # Mean distance is 0.2, so the mean similarity sits exactly at 0.8
+    assert abs(avg_relevance - 0.8) < 1e-9, f"Expected 0.8, got {avg_relevance}"
     print("✓ Relevance scoring works correctly")
     
     # Test precision
@@ -97,6 +195,10 @@ def test_context_coherence():
     coherence = metrics.get_context_coherence(coherent_distances)
     
     assert 0.85 < coherence < 1.0, f"Coherent results should be 0.85-1.0, got {coherence}"
+    
+    # Equal-length and ragged result sets are reduced at the same precision
+    assert abs(metrics.get_context_coherence([[0.1, 0.2], [0.3, 0.4]]) - 0.75) < 1e-12
+    assert abs(metrics.get_context_coherence([[0.1, 0.2], [0.3, 0.4, 0.35]]) - 0.75) < 1e-12
     print("✓ Context coherence calculation works correctly")
 
 
@@ -157,16 +259,51 @@ def test_benchmark_evaluation():
     print("✓ Benchmark evaluation works correctly")
 
 
+def test_benchmark_batch_evaluation():
+    """Test batched benchmark evaluation matches per-query evaluation."""
+    test_queries = [
+        "What is OOP?",
+        "How to optimize queries?",
+        "Explain MERN stack"
+    ]
+    
+    expected_domains = {
+        0: ["OOP", "Patterns"],
+        1: ["Database", "Performance"],
+        2: ["MERN", "Backend", "Frontend"]
+    }
+    
+    retrieved_per_query = [["OOP", "Patterns", "Backend"], ["Database"], []]
+    scores_per_query = [[0.9, 0.85, 0.6], [0.7], []]
+    
+    single = RetrievalBenchmark(test_queries, expected_domains)
+    for query_idx in range(len(test_queries)):
+        single.evaluate_query(query_idx, retrieved_per_query[query_idx], scores_per_query[query_idx])
+    
+    batch = RetrievalBenchmark(test_queries, expected_domains)
+    result = batch.evaluate_all(retrieved_per_query, scores_per_query)
+    
+    assert result["recall"][0] == 1.0, "Recall should be perfect for query 0"
+    assert result["precision"][2] == 0, "Precision should be 0 with nothing retrieved"
+    assert batch.get_benchmark_summary() == single.get_benchmark_summary(), \
+        "Batched and per-query summaries should match"
+    
+    for bad_retrieved, bad_scores in ((retrieved_per_query + [["OOP"]], scores_per_query),
+                                      (retrieved_per_query, scores_per_query[:2])):
+        with pytest.raises(ValueError):
+            batch.evaluate_all(bad_retrieved, bad_scores)
+    print("✓ Batched benchmark evaluation works correctly")
+
+
 def test_metrics_report():
     """Test comprehensive metrics report generation."""
     metrics = RetrievalMetrics()
     
-    # Add sample data
-    for i in range(10):
-        metrics.record_query_latency(100 + i * 5)
-        metrics.record_relevance_scores([0.1 + i * 0.02, 0.15 + i * 0.02])
-        metrics.record_domain_hit("Backend", 1)
-        metrics.record_chunk_hit(f"chunk_{i}")
+    # Add sample data in batches
+    metrics.record_query_latencies([100 + i * 5 for i in range(10)])
+    metrics.record_relevance_scores_batch([[0.1 + i * 0.02, 0.15 + i * 0.02] for i in range(10)])
+    metrics.record_domain_hit("Backend", 10)
+    metrics.record_chunk_hits([f"chunk_{i}" for i in range(10)])
     
     report = metrics.generate_report()
     
@@ -174,9 +311,102 @@ def test_metrics_report():
     assert "relevance_metrics" in report
     assert "coverage_metrics" in report
     assert report["query_statistics"]["total_queries"] == 10
+    assert abs(report["query_statistics"]["average_latency_ms"] - 122.5) < 1e-9
+    assert report["coverage_metrics"]["unique_chunks_hit"] == 10
     print("✓ Comprehensive metrics report generated successfully")
 
 
+def test_report_cache_invalidation():
+    """Test cached report statistics refresh after new data and are not shared."""
+    metrics = RetrievalMetrics()
+    metrics.record_query_latency(100)
+    metrics.record_relevance_scores([0.1])
+    
+    report = metrics.generate_report()
+    report["query_statistics"]["latency_percentiles"]["p50"] = -1
+    report["coverage_metrics"]["domain_coverage"]["Backend"] = -1
+    assert metrics.generate_report()["query_statistics"]["latency_percentiles"]["p50"] == 100.0
+    
+    metrics.record_query_latency(300)
+    metrics.record_relevance_scores([0.5])
+    metrics.domain_coverage["Backend"] += 3  # Direct Counter writes bypass record_*
+    report = metrics.generate_report()
+    assert report["query_statistics"]["total_queries"] == 2
+    assert report["query_statistics"]["latency_percentiles"]["p50"] == 200.0
+    assert abs(report["relevance_metrics"]["average_relevance_score"] - 0.7) < 1e-9
+    assert report["coverage_metrics"]["domain_coverage"] == {"Backend": 100.0}
+    
+    metrics.reset()
+    assert metrics.generate_report()["query_statistics"]["latency_percentiles"] == {}
+    print("✓ Report cache is invalidated by new data")
+
+
+def test_report_matches_getters_at_threshold():
+    """Test report relevance metrics agree with the getters for scores on the threshold."""
+    for distances in ([0.4] * 5, [0.4, 0.4, 0.3, 0.4, 0.4, 0.5]):
+        metrics = RetrievalMetrics()
+        metrics.record_relevance_scores(distances)
+        
+        relevance = metrics.generate_report()["relevance_metrics"]
+        assert relevance["top_5_precision"] == metrics.get_top_k_precision(k=5, threshold=0.6)
+        assert relevance["mean_reciprocal_rank"] == metrics.get_mean_reciprocal_rank(threshold=0.6)
+        assert relevance["average_relevance_score"] == metrics.get_average_relevance_score()
+    print("✓ Report relevance metrics match getters at the threshold")
+
+
+def test_bounded_sample_ring():
+    """Test max_samples keeps exactly the most recent samples across ring wrap-around."""
+    metrics = RetrievalMetrics(max_samples=5)
+    recent = deque(maxlen=5)
+    
+    # Single appends, a batch that wraps the ring, and one larger than the ring
+    for batch in ([0.1], [0.2, 0.3], [0.4], [0.05, 0.15, 0.25], [0.35], [0.01 * i for i in range(8)]):
+        if len(batch) == 1:
+            metrics.record_relevance_scores(batch)
+        else:
+            metrics.record_relevance_scores_batch([batch])
+        recent.extend(1 - d for d in batch)
+        assert sorted(metrics.relevance_scores.tolist()) == sorted(recent)
+    
+    for latency in range(1, 9):
+        metrics.record_query_latency(latency)
+    metrics.record_query_latencies([9, 10, 11])
+    assert sorted(metrics.latencies.tolist()) == [7.0, 8.0, 9.0, 10.0, 11.0]
+    assert metrics.query_count == 11, "Query count covers every recorded latency"
+    print("✓ Bounded sample ring keeps the most recent samples")
+
+
+def test_memmap_storage(tmp_path):
+    """Test memmap-backed metrics, shared storage directories and release_memory."""
+    first = RetrievalMetrics(max_samples=4, storage_dir=str(tmp_path))
+    second = RetrievalMetrics(max_samples=4, storage_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 4, "Each instance should own its sample files"
+    
+    first.record_query_latencies([1, 2, 3, 4, 5, 6])
+    second.record_query_latencies([100, 200])
+    assert sorted(first.latencies.tolist()) == [3.0, 4.0, 5.0, 6.0]
+    assert sorted(second.latencies.tolist()) == [100.0, 200.0]
+    
+    first.release_memory()
+    assert len(first.latencies) == 0, "Latencies should be empty after release_memory"
+    first.record_query_latency(7)
+    assert first.latencies.tolist() == [7.0]
+    
+    first.close()
+    assert len(list(tmp_path.iterdir())) == 2, "close() should delete the instance's files"
+    del second
+    gc.collect()
+    assert not list(tmp_path.iterdir()), "Collected instances should delete their files"
+    
+    unbounded = RetrievalMetrics()
+    unbounded.record_query_latencies(range(5000))
+    unbounded.release_memory()
+    assert len(unbounded.latencies) == 0 and unbounded.query_count == 0
+    unbounded.record_query_latency(1)
+    assert unbounded.get_average_latency() == 1.0
+    print("✓ Memmap storage and release_memory work correctly")
+
+
 def test_metrics_reset():
     """Test metrics reset functionality."""
     metrics = RetrievalMetrics()
@@ -195,46 +425,25 @@ def test_metrics_reset():
     print("✓ Metrics reset works correctly")
 
 
-def run_all_tests():
-    """Run all test cases."""
-    print("\n" + "="*50)
-    print("Running Retrieval Metrics Tests")
-    print("="*50 + "\n")
-    
-    tests = [
-        test_retrieval_metrics,
-        test_relevance_metrics,
-        test_domain_coverage,
-        test_chunk_retrieval,
-        test_context_coherence,
-        test_redundancy_score,
-        test_retrieval_coverage,
-        test_benchmark_evaluation,
-        test_metrics_report,
-        test_metrics_reset
-    ]
-    
-    passed = 0
-    failed = 0
-    
-    for test in tests:
-        try:
-            test()
-            passed += 1
-        except AssertionError as e:
-            print(f"✗ {test.__name__} failed: {e}")
-            failed += 1
-        except Exception as e:
-            print(f"✗ {test.__name__} error: {e}")
-            failed += 1
-    
-    print("\n" + "="*50)
-    print(f"Test Results: {passed} passed, {failed} failed")
-    print("="*50 + "\n")
-    
-    return failed == 0
-
-
-if __name__ == "__main__":
-    success = run_all_tests()
-    sys.exit(0 if success else 1)
+def test_config_is_read_only():
+    """Test config getters return deeply read-only snapshots that copy to plain dicts."""
+    import copy
+    from config import get_chunk_config, get_llm_config, update_chunk_size
+    
+    chunk_config = get_chunk_config()
+    with pytest.raises((TypeError, AttributeError)):
+        chunk_config["separators"].append("X")
+    with pytest.raises(TypeError):
+        get_llm_config()["openai"]["model"] = "other"
+    
+    editable = copy.deepcopy(get_llm_config())
+    editable["openai"]["model"] = "other"
+    assert get_llm_config()["openai"]["model"] != "other"
+    
+    original_size = chunk_config["chunk_size"]
+    try:
+        update_chunk_size(original_size + 1)
+        assert get_chunk_config()["chunk_size"] == original_size + 1
+    finally:
+        update_chunk_size(original_size)
+    print("✓ Configuration getters are read-only")